@@ -62,6 +62,9 @@ setup(
         "boto3>=1.12.0",
         "natsort>=7.1.0",
     ],
+    extras_require={
+        "orjson": ["orjson>=3.0.0"],
+    },
     zip_safe=False,
     dependency_links=[],
 )
@@ -65,8 +65,7 @@ def run(command: Command, option: dict = {}, page: int = None, page_size: int =
     try:
         if command is None:
             raise CommandInitiationFailedException('Command required argument')
-        optional['page'] = page if page is not None else None
-        optional['pageSize'] = page_size if page_size is not None else None
+        optional = {**optional, 'page': page, 'pageSize': page_size}
         return command.execute(session=DEFAULT_SESSION, option=option, optional=optional)
     except Exception as e:
         raise Exception(e)
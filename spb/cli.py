@@ -6,6 +6,7 @@ import os
 
 import spb
 from spb.cli_core.helper import Helper
+from spb.cli_core.utils import get_num_workers
 from spb.session import Session
 
 console = rich.console.Console()
@@ -143,4 +144,5 @@ def _get_project_with_name(project_name):
     return project
 
 def _initiation_cli():
-    spb.client()
\ No newline at end of file
+    # Keep a pooled API connection for every worker thread
+    spb.client(pool_maxsize=get_num_workers())
\ No newline at end of file
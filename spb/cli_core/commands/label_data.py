@@ -7,31 +7,46 @@ import rich.table
 import rich.console
 import rich.logging
 import math
-from multiprocessing import Process, Manager, Pool
+import functools
+import itertools
+import concurrent.futures
+from multiprocessing.pool import ThreadPool
+import shutil
 import tqdm
 import requests
-from collections import ChainMap
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 import spb
-from spb.cli_core.utils import recursive_glob_image_files, recursive_glob_label_files
+from spb.cli_core.utils import recursive_glob_image_files, recursive_glob_label_files, get_num_workers
 from spb.models.label import Label
 
 console = rich.console.Console()
 logger = logging.getLogger()
 simple_logger = logging.getLogger('simple')
-NUM_MULTI_PROCESS = 4
+NUM_WORKERS = get_num_workers()
 LABEL_DESCRIBE_PAGE_SIZE = 10
+ERROR_TABLE_PAGE_SIZE = 10
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+_SESSION = None
 
 
 class LabelData():
 
     def upload_data(self, project, dataset_name, directory_path, include_label, is_forced):
         imgs_path = recursive_glob_image_files(directory_path)
+        labels_path = recursive_glob_label_files(directory_path) if include_label else None
         if not is_forced:
-            if not click.confirm(f"Uploading {len(imgs_path)} data and {len(recursive_glob_label_files(directory_path)) if include_label else 0 } labels to dataset '{dataset_name}' under project '{project.name}'. Proceed?"):
+            if not click.confirm(f"Uploading {len(imgs_path)} data and {len(labels_path) if include_label else 0 } labels to dataset '{dataset_name}' under project '{project.name}'. Proceed?"):
                     return
         asset_images = []
-        manager = Manager()
+        data_results = {}
         if len(imgs_path) != 0:
             for key in imgs_path:
                 file_name = key
@@ -42,255 +57,304 @@ class LabelData():
                     'dataset': dataset_name
                 }
                 asset_images.append(asset_image)
-            data_results = manager.list([manager.dict()]*len(asset_images))
             console.print(f"Uploading data:")
-            with Pool(NUM_MULTI_PROCESS) as p:
-                list(tqdm.tqdm(p.imap(_upload_asset, zip([project.id] * len(asset_images), asset_images, data_results)), total=len(asset_images)))
-        else:
-            data_results = [{}]
+            with ThreadPool(NUM_WORKERS) as p:
+                for key, error in tqdm.tqdm(p.imap_unordered(functools.partial(_upload_asset, project.id), asset_images, chunksize=_chunksize(len(asset_images))), total=len(asset_images)):
+                    if error:
+                        data_results[key] = error
 
         label_results = None
         if include_label:
-            labels_path = recursive_glob_label_files(directory_path)
             console.print(f"Uploading labels:")
+            label_results = {}
             if len(labels_path) != 0:
-                label_results = manager.list([manager.dict()]*len(labels_path))
-                with Pool(NUM_MULTI_PROCESS) as p:
-                    list(tqdm.tqdm(p.imap(_update_label, zip(labels_path, [project.id]*len(labels_path), [dataset_name]*len(labels_path), label_results)), total=len(labels_path)))
-            else:
-                label_results = [{}]
+                described_labels = _prefetch_described_labels(project.id, dataset_name, len(labels_path))
+                with ThreadPool(NUM_WORKERS) as p:
+                    for key, error in tqdm.tqdm(p.imap_unordered(functools.partial(_update_label, project.id, dataset_name, described_labels), labels_path, chunksize=_chunksize(len(labels_path))), total=len(labels_path)):
+                        if error:
+                            label_results[key] = error
 
         console.print('\n[b blue]** Result Summary **[/b blue]')
-        success_data_count = len(asset_images) - len(data_results[0])
-        data_success_ratio = round(success_data_count/len(asset_images)*100,2) if len(data_results[0]) != 0 else 100
-        console.print(f'Successful upload of {success_data_count} out of {len(asset_images)} data. ({data_success_ratio}%) - [b red]{len(data_results[0])} ERRORS[/b red]')
+        self._print_result_summary('upload', 'data', len(asset_images), len(data_results))
 
         if include_label:
-            success_label_count=len(labels_path)-len(label_results[0])
-            label_success_ratio = round(success_label_count/len(labels_path)*100,2) if len(label_results[0]) != 0 else 100
-            console.print(f'Successful upload of {success_label_count} out of {len(labels_path)} labels. ({label_success_ratio}%) - [b red]{len(label_results[0])} ERRORS[/b red]')
-            self._print_error_table(dict(data_results[0]), dict(label_results[0]))
+            self._print_result_summary('upload', 'labels', len(labels_path), len(label_results))
+            self._print_error_table(data_results, label_results)
         else:
-            self._print_error_table(data_results=dict(data_results[0]))
+            self._print_error_table(data_results=data_results)
 
     def upload_label(self, project, dataset_name, directory_path, is_forced):
         labels_path = recursive_glob_label_files(directory_path)
         if not is_forced:
             if not click.confirm(f"Uploading {len(labels_path)} labels to project '{project.name}'. Proceed?"):
                 return
+        label_results = {}
         if len(labels_path) != 0:
-            manager = Manager()
-            label_results = manager.list([manager.dict()]*len(labels_path))
-            with Pool(NUM_MULTI_PROCESS) as p:
-                list(tqdm.tqdm(p.imap(_update_label, zip(labels_path, [project.id]*len(labels_path), [dataset_name]*len(labels_path), label_results)), total=len(labels_path)))
-        else:
-            label_results = [{}]
+            described_labels = _prefetch_described_labels(project.id, dataset_name, len(labels_path))
+            with ThreadPool(NUM_WORKERS) as p:
+                for key, error in tqdm.tqdm(p.imap_unordered(functools.partial(_update_label, project.id, dataset_name, described_labels), labels_path, chunksize=_chunksize(len(labels_path))), total=len(labels_path)):
+                    if error:
+                        label_results[key] = error
 
         console.print('\n[b blue]** Result Summary **[/b blue]')
-        success_label_count=len(labels_path)-len(label_results[0])
-        success_label_ratio = round(success_label_count/len(labels_path)*100,2) if len(labels_path) != 0 else 100
-        console.print(f'Successful upload of {success_label_count} out of {len(labels_path)} labels. ({success_label_ratio}%) - [b red]{len(label_results[0])} ERRORS[/b red]')
+        self._print_result_summary('upload', 'labels', len(labels_path), len(label_results))
 
-        self._print_error_table(label_results=dict(label_results[0]))
+        self._print_error_table(label_results=label_results)
 
     def download(self, project, directory_path, is_forced):
         command = spb.Command(type='describe_label')
         _, label_count = spb.run(command=command, option={
             'project_id' : project.id
         }, page_size = 1, page = 1)
+        data_results = {}
+        label_results = {}
         if label_count != 0:
-            page_length = int(label_count/LABEL_DESCRIBE_PAGE_SIZE) if label_count % LABEL_DESCRIBE_PAGE_SIZE == 0 else int(label_count/LABEL_DESCRIBE_PAGE_SIZE)+1
+            page_length = math.ceil(label_count/LABEL_DESCRIBE_PAGE_SIZE)
             if not is_forced:
                 if not click.confirm(f"Downloading {label_count} data and {label_count} labels from project '{project.name}' to '{directory_path}'. Proceed?"):
                     return
-            manager = Manager()
-            results = manager.list([manager.dict()]*page_length)
-            with Pool(NUM_MULTI_PROCESS) as p:
-                list(tqdm.tqdm(p.imap(_download_worker, zip([project.id] * page_length, range(page_length), [directory_path] * page_length, results)), total=page_length))
-
-            results = results[0]
-            data_results = {}
-            label_results = {}
-            if len(results) > 0:
-                for key in results.keys():
-                    if 'data' in results[key]:
-                        data_results[key] = results[key]['data']
-                    if 'label' in results[key]:
-                        label_results[key] = results[key]['label']
-        else:
-            label_results = {}
-            data_results = {}
+            _init_session()
+            option = {'project_id': project.id}
+            pages = iter(range(page_length))
+            describing = set()
+            downloading = set()
+            # Pages are described while earlier labels download. Another page is
+            # only requested while the labels in flight fit under the bound, so
+            # at most NUM_WORKERS * 2 + LABEL_DESCRIBE_PAGE_SIZE are held at once
+            with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_WORKERS) as describe_executor, concurrent.futures.ThreadPoolExecutor(max_workers=NUM_WORKERS) as download_executor, tqdm.tqdm(total=label_count) as progress:
+                while True:
+                    while len(downloading) + len(describing) * LABEL_DESCRIBE_PAGE_SIZE < NUM_WORKERS * 2:
+                        page_idx = next(pages, None)
+                        if page_idx is None:
+                            break
+                        describing.add(describe_executor.submit(_describe_label_page, option, page_idx))
+                    if not describing and not downloading:
+                        break
+                    done, _ = concurrent.futures.wait(describing | downloading, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done & describing:
+                        describing.remove(future)
+                        downloading.update(download_executor.submit(_download_label, directory_path, label) for label in future.result())
+                    _collect_download_errors(done & downloading, data_results, label_results, progress)
+                    downloading -= done
 
         console.print('\n[b blue]** Result Summary **[/b blue]')
-        label_success_count = label_count - len(label_results)
-        console.print(f'Successful download of {label_success_count} out of {label_count} labels. ({round(label_success_count/label_count*100,2)}%) - [b red]{len(label_results)} ERRORS[/b red]')
-        data_success_count = label_count - len(data_results)
-        console.print(f'Successful download of {data_success_count} out of {label_count} data. ({round(data_success_count/label_count*100,2)}%) - [b red]{len(data_results)} ERRORS[/b red]')
+        self._print_result_summary('download', 'labels', label_count, len(label_results))
+        self._print_result_summary('download', 'data', label_count, len(data_results))
 
         self._print_error_table(label_results=label_results, data_results=data_results)
 
+    def _print_result_summary(self, action, target, total_count, error_count):
+        success_count = total_count - error_count
+        success_ratio = round(success_count/total_count*100,2) if total_count != 0 else 100
+        console.print(f'Successful {action} of {success_count} out of {total_count} {target}. ({success_ratio}%) - [b red]{error_count} ERRORS[/b red]')
+
     def _print_error_table(self, data_results = None, label_results = None):
-        results = {}
-
-        if isinstance(data_results, dict):
-            for key in data_results:
-                results[key] = {}
-                results[key]['data'] = data_results[key]
-                results[key]['label'] = None
-        if isinstance(label_results, dict):
-            for key in label_results:
-                if key in results:
-                    results[key]['label'] = label_results[key]
-                else:
-                    results[key] = {'label':label_results[key], 'data':None}
-
-        if not next(iter(results), None):
-                return
+        if not data_results and not label_results:
+            return
+        show_data = isinstance(data_results, dict)
+        show_label = isinstance(label_results, dict)
+        data_errors = data_results if show_data else {}
+        label_errors = label_results if show_label else {}
+        # Data keys first, then label-only keys, each listed once
+        keys = dict.fromkeys(itertools.chain(data_errors, label_errors))
+        items = [(key, {'data': data_errors.get(key), 'label': label_errors.get(key)}) for key in keys]
+
         console.print('\n[b red]** Error Table **[/b red]')
-        page = 1
-        page_length = math.ceil(len(results)/10)
-        while True:
+        page_length = math.ceil(len(items)/ERROR_TABLE_PAGE_SIZE)
+        for page, page_start in enumerate(range(0, len(items), ERROR_TABLE_PAGE_SIZE), 1):
             table = rich.table.Table(show_header=True, header_style="bold magenta")
             table.add_column("FILE NAME")
-            if isinstance(data_results, dict):
+            if show_data:
                 table.add_column("DATA UPLOAD")
-            if isinstance(label_results, dict):
+            if show_label:
                 table.add_column("LABEL UPLOAD")
 
-            for _ in range(10):
-                key = next(iter(results), None)
-                if not key:
-                    break
-                if isinstance(data_results, dict) and isinstance(label_results, dict):
-                    data = results[key]['data']
-                    label = results[key]['label']
-                    table.add_row(key, f"{data if data else '-'}", f"{label if label else '-'}")
-                elif isinstance(data_results, dict):
-                    data = results[key]['data']
-                    table.add_row(key, f"{data if data else '-'}")
-                else:
-                    label = results[key]['label']
-                    table.add_row(key, f"{label if label else '-'}")
-                del results[key]
+            for key, result in items[page_start:page_start + ERROR_TABLE_PAGE_SIZE]:
+                row = [key]
+                if show_data:
+                    row.append(f"{result['data'] if result['data'] else '-'}")
+                if show_label:
+                    row.append(f"{result['label'] if result['label'] else '-'}")
+                table.add_row(*row)
             console.print(table)
-            if not next(iter(results), None):
+            if page == page_length:
+                break
+            click.echo(f'Press any button to continue to the next page ({page}/{page_length}). Otherwise press ‘Q’ to quit.', nl=False)
+            key = click.getchar()
+            click.echo()
+            if key=='q' or key=='Q':
                 break
-            else:
-                click.echo(f'Press any button to continue to the next page ({page}/{page_length}). Otherwise press ‘Q’ to quit.', nl=False)
-                key = click.getchar()
-                click.echo()
-                if key=='q' or key=='Q':
-                    break
         console.log(f'[b]Check the log file for more details[/b]')
         console.log(f'- {simple_logger.handlers[0].baseFilename}')
         console.log(f'- {logger.handlers[0].baseFilename}')
 
 
 
-def _download_worker(args):
-    [project_id, page_idx, directory_path, result] = args
+def _chunksize(total):
+    return max(1, total // (NUM_WORKERS * 4))
+
+
+def _init_session():
+    # Shared by every worker thread so downloads reuse keep-alive connections
+    global _SESSION
+    if _SESSION is not None:
+        return
+    _SESSION = requests.Session()
+    adapter = HTTPAdapter(pool_connections=NUM_WORKERS, pool_maxsize=NUM_WORKERS, max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504]))
+    _SESSION.mount('https://', adapter)
+    _SESSION.mount('http://', adapter)
+
+
+def _describe_label_page(option, page_idx):
     command = spb.Command(type='describe_label')
-    labels, _ = spb.run(command=command, option={
-        'project_id' : project_id
-    }, page_size = LABEL_DESCRIBE_PAGE_SIZE, page = page_idx + 1)
-    for label in labels:
-        error = {}
-        path = os.path.join(label.dataset, label.data_key[1:]) if label.data_key.startswith('/') else os.path.join(label.dataset, label.data_key)
-        path = os.path.join(directory_path, path)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        label_error = None
-        data_error = None
-        try:
-            label_json_path = f'{path}.json'
-            open(label_json_path, 'w').write(label.toJson())
-        except Exception as e:
-            error = {'label':str(e)}
-            label_error = error
-        try:
-            data_url = label.data_url
-            path = f'{path}'
-            r = requests.get(data_url, allow_redirects=True)
-            open(path, 'wb').write(r.content)
-        except Exception as e:
-            error.update({'data':str(e)})
-            data_error = error
-
-        if len(error) > 0:
-            result[f'{label.dataset}/{label.data_key}'] = error
-            if label_error:
-                _ = dict()
-                _set_error_result(f'{label.dataset}/{label.data_key}', _, str(label_error), label_error)
-            if data_error:
-                _ = dict()
-                _set_error_result(f'{label.dataset}/{label.data_key}', _, str(data_error), data_error)
-
-
-def _upload_asset(args):
-    logging.debug(f'Uploading Asset: {args}')
-
-    [project_id, asset_image, result] = args
+    labels, _ = spb.run(command=command, option=option, page_size = LABEL_DESCRIBE_PAGE_SIZE, page = page_idx + 1)
+    return labels
+
+
+def _prefetch_described_labels(project_id, dataset, label_file_count):
+    # Describing the whole dataset page by page only pays off when it takes
+    # fewer requests than describing each label file on its own
+    option = {
+        'project_id': project_id,
+        'dataset': dataset
+    }
+    try:
+        command = spb.Command(type='describe_label')
+        _, label_count = spb.run(command=command, option=option, page_size=1, page=1)
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        return None
+    page_length = math.ceil(label_count/LABEL_DESCRIBE_PAGE_SIZE)
+    if page_length == 0 or page_length >= label_file_count:
+        return None
+
+    described_labels = {}
+    try:
+        with ThreadPool(NUM_WORKERS) as p:
+            for labels in p.imap_unordered(functools.partial(_describe_label_page, option), range(page_length), chunksize=_chunksize(page_length)):
+                for label in labels:
+                    described_labels[label.data_key] = label
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        return None
+    return described_labels
+
+
+def _collect_download_errors(futures, data_results, label_results, progress):
+    for future in futures:
+        key, error = future.result()
+        if 'data' in error:
+            data_results[key] = error['data']
+        if 'label' in error:
+            label_results[key] = error['label']
+        progress.update()
+
+
+def _download_label(directory_path, label):
+    key = f'{label.dataset}/{label.data_key}'
+    error = {}
+    path = os.path.join(label.dataset, label.data_key[1:]) if label.data_key.startswith('/') else os.path.join(label.dataset, label.data_key)
+    path = os.path.join(directory_path, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        label_json_path = f'{path}.json'
+        with open(label_json_path, 'w') as f:
+            f.write(label.toJson())
+    except Exception as e:
+        error['label'] = str(e)
+        _set_error_result(key, str(e), e)
+    try:
+        data_url = label.data_url
+        with _SESSION.get(data_url, allow_redirects=True, stream=True, timeout=(5, 60)) as r:
+            r.raise_for_status()
+            # Save gzip-encoded responses decoded; identity bodies are copied as is
+            r.raw.decode_content = True
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(r.raw, f, length=DOWNLOAD_CHUNK_SIZE)
+    except Exception as e:
+        error['data'] = str(e)
+        _set_error_result(key, str(e), e)
+    return key, error
+
+
+def _upload_asset(project_id, asset_image):
+    logging.debug(f'Uploading Asset: {asset_image}')
+
     try:
         command = spb.Command(type='create_data')
         spb.run(command=command, option=asset_image, optional={'projectId': project_id})
     except Exception as e:
-        _set_error_result(asset_image['data_key'], result, str(e), e)
-        pass
+        _set_error_result(asset_image['data_key'], str(e), e)
+        return asset_image['data_key'], str(e)
+    return asset_image['data_key'], None
 
 
-def _update_label(args):
-    [label_path, project_id, dataset, result] = args
-    data_key = ".".join(label_path.split(".")[:-1])
+def _update_label(project_id, dataset, described_labels, label_path):
+    data_key, _ = os.path.splitext(label_path)
     if not os.path.isfile(label_path):
-        _set_error_result(data_key, result, 'Label json file is not existed.')
-        return
+        return data_key, _set_error_result(data_key, 'Label json file is not existed.')
 
-    option = {
-        'project_id': project_id,
-        'dataset': dataset,
-        'data_key': data_key
-    }
     try:
-        command = spb.Command(type='describe_label')
-        described_labels, _ = spb.run(command=command, option=option, page_size=1, page=1)
-        described_label = described_labels[0] if described_labels and described_labels[0] else None
+        with open(label_path, 'rb') as json_file:
+            raw_label = json_file.read()
+        json_data = _json_loads(raw_label)
+        # Nothing to update, so skip the describe and update round-trips
+        if json_data['result'] is None:
+            return data_key, None
+    except Exception as e:
+        return data_key, _set_error_result(data_key, str(e), e)
+
+    try:
+        described_label = described_labels.get(data_key) if described_labels else None
         if described_label is None:
-            _set_error_result(data_key, result, 'Label cannot be described.')
-            return
-        if described_label.data_key != option['data_key'] and described_label.dataset != option['dataset']:
-            _set_error_result(data_key, result, 'Described label does not match to upload.')
-            return
+            option = {
+                'project_id': project_id,
+                'dataset': dataset,
+                'data_key': data_key
+            }
+            command = spb.Command(type='describe_label')
+            labels, _ = spb.run(command=command, option=option, page_size=1, page=1)
+            described_label = labels[0] if labels and labels[0] else None
+        if described_label is None:
+            return data_key, _set_error_result(data_key, 'Label cannot be described.')
+        if described_label.data_key != data_key and described_label.dataset != dataset:
+            return data_key, _set_error_result(data_key, 'Described label does not match to upload.')
     except Exception as e:
-        _set_error_result(data_key, result, str(e), e)
-        return
+        return data_key, _set_error_result(data_key, str(e), e)
     
     label = {
         "id": described_label.id,
         "project_id": project_id,
         "tags": [tag.get_datas(tag) for tag in described_label.tags],
-        "result": described_label.result,
+        "result": json_data['result'],
     }
+    if 'tags' in json_data:
+        label['tags'] = json_data['tags']
     try:
-        with open(label_path) as json_file:
-            json_data = json.load(json_file)
-        if json_data['result'] is None:
-            return
-
-        if 'result' in json_data:
-            label['result'] = json_data['result']
-        if 'tags' in json_data:
-            label['tags'] = json_data['tags']
         command = spb.Command(type='update_label')
         label = spb.run(command=command, option=label)
-        with open(label_path, 'w') as f:
-            f.write(label.toJson())
+        label_json = label.toJson()
+        if label_json.encode('utf-8') != raw_label:
+            with open(label_path, 'w') as f:
+                f.write(label_json)
     except Exception as e:
-        _set_error_result(data_key, result, str(e), e)
+        return data_key, _set_error_result(data_key, str(e), e)
+    return data_key, None
+
+def _json_loads(raw):
+    # orjson rejects the NaN and Infinity that Label.toJson can write
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(raw)
 
-def _set_error_result(key, result, message, exception=None):
-    result[key] = message
+def _set_error_result(key, message, exception=None):
     simple_logger.error(f'{key}    {message}')
     if exception:
         logger.error(f'{key}    {message}')
         logger.error(exception, exc_info=True)
     else:
-        logger.error(f'{key}    {message}')
\ No newline at end of file
+        logger.error(f'{key}    {message}')
+    return message
@@ -7,10 +7,9 @@ import rich.table
 import rich.console
 import rich.logging
 import math
-from multiprocessing import Process, Manager, Pool
+from multiprocessing import Pool
 import tqdm
 import requests
-from collections import ChainMap
 
 import spb
 from spb.cli_core.utils import recursive_glob_video_paths, recursive_glob_label_files
@@ -26,11 +25,12 @@ LABEL_DESCRIBE_PAGE_SIZE = 10
 class VideoLabelData():
     def upload_data(self, project, dataset_name, directory_path, include_label, is_forced):
         video_paths = recursive_glob_video_paths(directory_path)
+        labels_path = recursive_glob_label_files(directory_path) if include_label else None
         if not is_forced:
-            if not click.confirm(f"Uploading {len(video_paths)} data and {len(recursive_glob_label_files(directory_path)) if include_label else 0 } labels to dataset '{dataset_name}' under project '{project.name}'. Proceed?"):
+            if not click.confirm(f"Uploading {len(video_paths)} data and {len(labels_path) if include_label else 0 } labels to dataset '{dataset_name}' under project '{project.name}'. Proceed?"):
                 return
         asset_videos = []
-        manager = Manager()
+        data_results = {}
         if len(video_paths) != 0:
             for key in video_paths:
                 file_name = key
@@ -40,91 +40,73 @@ class VideoLabelData():
                     'dataset': dataset_name
                 }
                 asset_videos.append(asset_video)
-            data_results = manager.list([manager.dict()]*len(asset_videos))
             console.print(f"Uploading data:")
             with Pool(NUM_MULTI_PROCESS) as p:
-                list(tqdm.tqdm(p.imap(_upload_asset, zip([project.id] * len(asset_videos), asset_videos, data_results)), total=len(asset_videos)))
-        else:
-            data_results = [{}]
+                for key, error in tqdm.tqdm(p.imap_unordered(_upload_asset, zip([project.id] * len(asset_videos), asset_videos), chunksize=_chunksize(len(asset_videos))), total=len(asset_videos)):
+                    if error:
+                        data_results[key] = error
 
         label_results = None
         if include_label:
-            labels_path = recursive_glob_label_files(directory_path)
             console.print(f"Uploading labels:")
+            label_results = {}
             if len(labels_path) != 0:
-                label_results = manager.list([manager.dict()]*len(labels_path))
                 with Pool(NUM_MULTI_PROCESS) as p:
-                    list(tqdm.tqdm(p.imap(_update_label, zip(labels_path, [project.id]*len(labels_path), [dataset_name]*len(labels_path), label_results)), total=len(labels_path)))
-            else:
-                label_results = [{}]
+                    for key, error in tqdm.tqdm(p.imap_unordered(_update_label, zip(labels_path, [project.id]*len(labels_path), [dataset_name]*len(labels_path)), chunksize=_chunksize(len(labels_path))), total=len(labels_path)):
+                        if error:
+                            label_results[key] = error
 
         console.print('\n[b blue]** Result Summary **[/b blue]')
-        success_data_count = len(asset_videos) - len(data_results[0])
-        data_success_ratio = round(success_data_count/len(asset_videos)*100,2) if len(data_results[0]) != 0 else 100
-        console.print(f'Successful upload of {success_data_count} out of {len(asset_videos)} data. ({data_success_ratio}%) - [b red]{len(data_results[0])} ERRORS[/b red]')
+        success_data_count = len(asset_videos) - len(data_results)
+        data_success_ratio = round(success_data_count/len(asset_videos)*100,2) if len(data_results) != 0 else 100
+        console.print(f'Successful upload of {success_data_count} out of {len(asset_videos)} data. ({data_success_ratio}%) - [b red]{len(data_results)} ERRORS[/b red]')
 
         if include_label:
-            success_label_count=len(labels_path)-len(label_results[0])
-            label_success_ratio = round(success_label_count/len(labels_path)*100,2) if len(label_results[0]) != 0 else 100
-            console.print(f'Successful upload of {success_label_count} out of {len(labels_path)} labels. ({label_success_ratio}%) - [b red]{len(label_results[0])} ERRORS[/b red]')
-            self._print_error_table(dict(data_results[0]), dict(label_results[0]))
+            success_label_count=len(labels_path)-len(label_results)
+            label_success_ratio = round(success_label_count/len(labels_path)*100,2) if len(label_results) != 0 else 100
+            console.print(f'Successful upload of {success_label_count} out of {len(labels_path)} labels. ({label_success_ratio}%) - [b red]{len(label_results)} ERRORS[/b red]')
+            self._print_error_table(data_results, label_results)
         else:
-            self._print_error_table(data_results=dict(data_results[0]))
-
-        self._print_error_table(data_results=dict(data_results[0]))
+            self._print_error_table(data_results=data_results)
 
     def upload_label(self, project, dataset_name, directory_path, is_forced):
         labels_path = recursive_glob_label_files(directory_path)
         if not is_forced:
             if not click.confirm(f"Uploading {len(labels_path)} labels to project '{project.name}'. Proceed?"):
                 return
+        label_results = {}
         if len(labels_path) != 0:
-            manager = Manager()
-            label_results = manager.list([manager.dict()]*len(labels_path))
             with Pool(NUM_MULTI_PROCESS) as p:
-                list(tqdm.tqdm(p.imap(_update_label, zip(labels_path, [project.id]*len(labels_path), [dataset_name]*len(labels_path), label_results)), total=len(labels_path)))
-        else:
-            label_results = [{}]
+                for key, error in tqdm.tqdm(p.imap_unordered(_update_label, zip(labels_path, [project.id]*len(labels_path), [dataset_name]*len(labels_path)), chunksize=_chunksize(len(labels_path))), total=len(labels_path)):
+                    if error:
+                        label_results[key] = error
 
         console.print('\n[b blue]** Result Summary **[/b blue]')
-        success_label_count=len(labels_path)-len(label_results[0])
+        success_label_count=len(labels_path)-len(label_results)
         success_label_ratio = round(success_label_count/len(labels_path)*100,2) if len(labels_path) != 0 else 100
-        console.print(f'Successful upload of {success_label_count} out of {len(labels_path)} labels. ({success_label_ratio}%) - [b red]{len(label_results[0])} ERRORS[/b red]')
+        console.print(f'Successful upload of {success_label_count} out of {len(labels_path)} labels. ({success_label_ratio}%) - [b red]{len(label_results)} ERRORS[/b red]')
 
-        self._print_error_table(label_results=dict(label_results[0]))
+        self._print_error_table(label_results=label_results)
 
     def download(self, project, directory_path, is_forced):
         command = spb.Command(type='describe_videolabel')
         _, label_count = spb.run(command=command, option={
             'project_id' : project.id
         }, page_size = 1, page = 1)
+        data_results = {}
+        label_results = {}
         if label_count != 0:
-            page_length = int(label_count/LABEL_DESCRIBE_PAGE_SIZE) if label_count % LABEL_DESCRIBE_PAGE_SIZE == 0 else int(label_count/LABEL_DESCRIBE_PAGE_SIZE)+1
+            page_length = math.ceil(label_count/LABEL_DESCRIBE_PAGE_SIZE)
             if not is_forced:
                 if not click.confirm(f"Downloading {label_count} data and {label_count} labels from project '{project.name}' to '{directory_path}'. Proceed?"):
                     return
-            manager = Manager()
-            results = manager.list([manager.dict()]*page_length)
-
-            # inputs = zip([project.id] * page_length, range(page_length), [directory_path] * page_length, results)
-            # for i in inputs:
-            #     _download_worker(i)
-
             with Pool(NUM_MULTI_PROCESS) as p:
-                list(tqdm.tqdm(p.imap(_download_worker, zip([project.id] * page_length, range(page_length), [directory_path] * page_length, results)), total=page_length))
-
-            results = results[0]
-            data_results = {}
-            label_results = {}
-            if len(results) > 0:
-                for key in results.keys():
-                    if 'data' in results[key]:
-                        data_results[key] = results[key]['data']
-                    if 'label' in results[key]:
-                        label_results[key] = results[key]['label']
-        else:
-            label_results = {}
-            data_results = {}
+                for errors in tqdm.tqdm(p.imap_unordered(_download_worker, zip([project.id] * page_length, range(page_length), [directory_path] * page_length), chunksize=_chunksize(page_length)), total=page_length):
+                    for key, error in errors.items():
+                        if 'data' in error:
+                            data_results[key] = error['data']
+                        if 'label' in error:
+                            label_results[key] = error['label']
 
         console.print('\n[b blue]** Result Summary **[/b blue]')
         label_success_count = label_count - len(label_results)
@@ -192,25 +174,29 @@ class VideoLabelData():
 
 
 
+def _chunksize(total):
+    return max(1, total // (NUM_MULTI_PROCESS * 4))
+
+
 def _download_worker(args):
-    [project_id, page_idx, directory_path, result] = args
+    [project_id, page_idx, directory_path] = args
     command = spb.Command(type='describe_videolabel')
     labels, _ = spb.run(command=command, option={
         'project_id' : project_id
     }, page_size = LABEL_DESCRIBE_PAGE_SIZE, page = page_idx + 1)
+    errors = {}
     for label in labels:
+        key = f'{label.dataset}/{label.data_key}'
         error = {}
         path = os.path.join(label.dataset, label.data_key[1:]) if label.data_key.startswith('/') else os.path.join(label.dataset, label.data_key)
         path = os.path.join(directory_path, path)
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        label_error = None
-        data_error = None
         try:
             label_json_path = f'{path}.json'
             open(label_json_path, 'w').write(label.toJson())
         except Exception as e:
-            error = {'label':str(e)}
-            label_error = error
+            error['label'] = str(e)
+            _set_error_result(key, str(e), e)
         try:
             custom_signed_url = json.loads(label.data_url)
             base_url = custom_signed_url['base_url']
@@ -226,22 +212,17 @@ def _download_worker(args):
                 r = requests.get(file_url, allow_redirects=True)
                 open(file_path, 'wb').write(r.content)
         except Exception as e:
-            error.update({'data':str(e)})
-            data_error = error
+            error['data'] = str(e)
+            _set_error_result(key, str(e), e)
 
         if len(error) > 0:
-            result[f'{label.dataset}/{label.data_key}'] = error
-            if label_error:
-                _ = dict()
-                _set_error_result(f'{label.dataset}/{label.data_key}', _, str(label_error), label_error)
-            if data_error:
-                _ = dict()
-                _set_error_result(f'{label.dataset}/{label.data_key}', _, str(data_error), data_error)
+            errors[key] = error
+    return errors
 
 
 def _upload_asset(args):
     logging.debug(f'Uploading Asset: {args}')
-    [project_id, asset_video, result] = args
+    [project_id, asset_video] = args
     try:
         command = spb.Command(type='create_videodata')
         result = spb.run(command=command, option=asset_video, optional={'projectId': project_id})
@@ -255,16 +236,15 @@ def _upload_asset(args):
             response = requests.put(file_info['presigned_url'],data=data)
             
     except Exception as e:
-        _set_error_result(asset_video['data_key'], result, str(e), e)
-        pass
+        return asset_video['data_key'], _set_error_result(asset_video['data_key'], str(e), e)
+    return asset_video['data_key'], None
 
 
 def _update_label(args):
-    [label_path, project_id, dataset, result] = args
+    [label_path, project_id, dataset] = args
     data_key = ".".join(label_path.split(".")[:-1])
     if not os.path.isfile(label_path):
-        _set_error_result(data_key, result, 'Label json file is not existed.')
-        return
+        return data_key, _set_error_result(data_key, 'Label json file is not existed.')
 
     option = {
         'project_id': project_id,
@@ -276,14 +256,11 @@ def _update_label(args):
         described_labels, _ = spb.run(command=command, option=option, page_size=1, page=1)
         described_label = described_labels[0] if described_labels and described_labels[0] else None
         if described_label is None:
-            _set_error_result(data_key, result, 'Label cannot be described.')
-            return
+            return data_key, _set_error_result(data_key, 'Label cannot be described.')
         if described_label.data_key != option['data_key'] and described_label.dataset != option['dataset']:
-            _set_error_result(data_key, result, 'Described label does not match to upload.')
-            return
+            return data_key, _set_error_result(data_key, 'Described label does not match to upload.')
     except Exception as e:
-        _set_error_result(data_key, result, str(e), e)
-        return
+        return data_key, _set_error_result(data_key, str(e), e)
     
     label = {
         "id": described_label.id,
@@ -295,7 +272,7 @@ def _update_label(args):
             json_data = json.load(json_file)
         # TODO: NEED info.json VALIDATION
         if json_data['result'] is None:
-            return
+            return data_key, None
         else:
             read_response = requests.get(described_label.info_read_presigned_url)
             info_json = read_response.json()
@@ -309,13 +286,14 @@ def _update_label(args):
         with open(label_path, 'w') as f:
             f.write(label.toJson())
     except Exception as e:
-        _set_error_result(data_key, result, str(e), e)
+        return data_key, _set_error_result(data_key, str(e), e)
+    return data_key, None
 
-def _set_error_result(key, result, message, exception=None):
-    result[key] = message
+def _set_error_result(key, message, exception=None):
     simple_logger.error(f'{key}    {message}')
     if exception:
         logger.error(f'{key}    {message}')
         logger.error(exception, exc_info=True)
     else:
-        logger.error(f'{key}    {message}')
\ No newline at end of file
+        logger.error(f'{key}    {message}')
+    return message
@@ -1,10 +1,23 @@
 import re
 import os
+import logging
 import glob
 import imghdr
 from imghdr import tests
 from natsort import natsorted
 
+def get_num_workers():
+    # Transfers are I/O-bound, so run more worker threads than cores
+    default = min(32, (os.cpu_count() or 4) * 4)
+    value = os.getenv('SPB_CLI_WORKERS')
+    if value is None:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logging.getLogger().warning(f'Ignoring SPB_CLI_WORKERS={value!r}, which is not an integer. Using {default} workers.')
+        return default
+
 def get_project_config(line):
     r = re.compile(r'([^\t]*)\t*')
     return r.findall(line)
@@ -1,6 +1,7 @@
 import os
 import configparser
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import copy
 import base64
@@ -9,6 +10,8 @@ from spb.command import Command
 from spb.models.project import Project
 from spb.exceptions.exceptions import APIException, SDKInitiationFailedException, AuthenticateFailedException, APILimitExceededException, APIUnknownException
 
+HTTP_POOL_MAXSIZE = 32
+
 class Session:
     endpoint = os.getenv("SPB_APP_API_ENDPOINT", "https://api.superb-ai.com/graphql")
     headers = {
@@ -18,8 +21,11 @@ class Session:
         'Authorization': None
     }
 
-    def __init__(self, profile=None, account_name=None, access_key=None):
+    def __init__(self, profile=None, account_name=None, access_key=None, pool_maxsize=HTTP_POOL_MAXSIZE):
         self.credential = None
+        self.pool_maxsize = pool_maxsize
+        self._http = None
+        self._http_pid = None
         self._set_credential(
             profile=profile, account_name=account_name, access_key=access_key)
 
@@ -71,6 +77,18 @@ class Session:
                     '** [ERROR] credential - key [{0}] does not exists'.format(var))
         return ret
 
+    def _get_http(self):
+        # Reuse keep-alive connections to the endpoint across requests, but
+        # never share them with a forked worker process
+        if self._http is None or self._http_pid != os.getpid():
+            http = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=self.pool_maxsize)
+            http.mount('https://', adapter)
+            http.mount('http://', adapter)
+            self._http = http
+            self._http_pid = os.getpid()
+        return self._http
+
     def validate(self):
         # TODO(mjlee): 나중에 root에 validate url 이 새로 열릴 예정임
         data = {
@@ -79,8 +97,8 @@ class Session:
         }
         data = json.dumps(data)
         try:
-            response = requests.request(
-                "POST", self.endpoint, data=data, headers=self.headers)
+            response = self._get_http().post(
+                self.endpoint, data=data, headers=self.headers)
         except requests.exceptions.Timeout:
             raise APIException('Occurred Time out of this request')
         except requests.exceptions.RequestException:
@@ -113,8 +131,8 @@ class Session:
         }
         data = json.dumps(data)
         try:
-            response = requests.request(
-                "POST", self.endpoint, data=data, headers=self.headers)
+            response = self._get_http().post(
+                self.endpoint, data=data, headers=self.headers)
         except requests.exceptions.Timeout:
             raise APIException('Occurred Time out of this request')
         except requests.exceptions.RequestException:
@@ -0,0 +1,266 @@
+import io
+import json
+import logging
+import math
+import threading
+import time
+import click
+import pytest
+import rich.console
+
+import spb
+import spb.cli_core.commands.label_data as label_data
+from spb.command.commands import CreateCommand, DescribeCommand, UpdateCommand
+from spb.models.label import Label
+from spb.models.project import Project
+
+
+def make_label(data_key, result=None):
+    return Label(id=f'id-{data_key}', project_id='project', tags=[], status='SUBMITTED', stats=None,
+                 data_id='data', dataset='dataset', data_key=data_key, data_url='', result=result)
+
+def make_project():
+    return Project(id='project', name='project')
+
+class FakeAPI:
+    def __init__(self, dataset_labels=(), fail=False):
+        self.dataset_labels = list(dataset_labels)
+        self.fail = fail
+        self.calls = []
+
+    def run(self, command, option={}, page=None, page_size=None, optional={}):
+        self.calls.append((command, option, page, page_size))
+        if self.fail:
+            raise Exception('API is not available')
+        if isinstance(command, UpdateCommand):
+            return make_label(option['id'][len('id-'):], option['result'])
+        labels = self.dataset_labels
+        if 'data_key' in option:
+            labels = [label for label in labels if label.data_key == option['data_key']]
+        start = (page - 1) * page_size
+        return labels[start:start + page_size], len(labels)
+
+    def describe_calls(self, with_data_key):
+        return [call for call in self.calls if isinstance(call[0], DescribeCommand) and ('data_key' in call[1]) == with_data_key]
+
+@pytest.fixture
+def label_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def write_label(name, content):
+    with open(name, 'w') as f:
+        f.write(content)
+
+def test_prefetch_describes_dataset_when_cheaper(monkeypatch):
+    api = FakeAPI([make_label(f'img-{i}.png') for i in range(15)])
+    monkeypatch.setattr(spb, 'run', api.run)
+
+    described_labels = label_data._prefetch_described_labels('project', 'dataset', 20)
+
+    assert sorted(described_labels) == sorted(f'img-{i}.png' for i in range(15))
+    assert len(api.calls) == 3
+
+def test_prefetch_is_skipped_when_not_cheaper(monkeypatch):
+    api = FakeAPI([make_label(f'img-{i}.png') for i in range(15)])
+    monkeypatch.setattr(spb, 'run', api.run)
+
+    assert label_data._prefetch_described_labels('project', 'dataset', 2) is None
+    assert len(api.calls) == 1
+
+def test_prefetch_returns_none_on_failure(monkeypatch):
+    api = FakeAPI(fail=True)
+    monkeypatch.setattr(spb, 'run', api.run)
+
+    assert label_data._prefetch_described_labels('project', 'dataset', 20) is None
+
+def test_update_label_uses_prefetched_label(label_dir, monkeypatch):
+    api = FakeAPI([make_label('img.png')])
+    monkeypatch.setattr(spb, 'run', api.run)
+    write_label('img.png.json', json.dumps({'result': {'objects': []}}))
+
+    key, error = label_data._update_label('project', 'dataset', {'img.png': make_label('img.png')}, 'img.png.json')
+
+    assert (key, error) == ('img.png', None)
+    assert api.describe_calls(with_data_key=True) == []
+
+def test_update_label_falls_back_to_describe_on_prefetch_miss(label_dir, monkeypatch):
+    api = FakeAPI([make_label('img.png')])
+    monkeypatch.setattr(spb, 'run', api.run)
+    write_label('img.png.json', json.dumps({'result': {'objects': []}}))
+
+    key, error = label_data._update_label('project', 'dataset', {'other.png': make_label('other.png')}, 'img.png.json')
+
+    assert (key, error) == ('img.png', None)
+    assert len(api.describe_calls(with_data_key=True)) == 1
+
+def test_update_label_skips_null_result_without_api_calls(label_dir, monkeypatch):
+    api = FakeAPI()
+    monkeypatch.setattr(spb, 'run', api.run)
+    write_label('img.png.json', json.dumps({'result': None}))
+
+    assert label_data._update_label('project', 'dataset', None, 'img.png.json') == ('img.png', None)
+    assert api.calls == []
+
+def test_update_label_rewrites_file_only_when_changed(label_dir, monkeypatch):
+    api = FakeAPI([make_label('same.png'), make_label('changed.png')])
+    monkeypatch.setattr(spb, 'run', api.run)
+    write_label('same.png.json', make_label('same.png', {'objects': []}).toJson())
+    write_label('changed.png.json', json.dumps({'result': {'objects': []}}))
+    write_modes = []
+    def tracking_open(file, mode='r', *args, **kwargs):
+        if 'w' in mode:
+            write_modes.append(file)
+        return open(file, mode, *args, **kwargs)
+    monkeypatch.setattr(label_data, 'open', tracking_open, raising=False)
+
+    label_data._update_label('project', 'dataset', None, 'same.png.json')
+    label_data._update_label('project', 'dataset', None, 'changed.png.json')
+
+    assert write_modes == ['changed.png.json']
+    with open('changed.png.json') as f:
+        assert f.read() == make_label('changed.png', {'objects': []}).toJson()
+
+class FailingCreateAPI(FakeAPI):
+    def __init__(self, dataset_labels=(), failing_keys=()):
+        super().__init__(dataset_labels)
+        self.failing_keys = failing_keys
+
+    def run(self, command, option={}, page=None, page_size=None, optional={}):
+        if isinstance(command, CreateCommand):
+            self.calls.append((command, option, page, page_size))
+            if option['data_key'] in self.failing_keys:
+                raise Exception('Upload failed')
+            return None
+        return super().run(command, option, page, page_size, optional)
+
+def capture_results(monkeypatch, cls):
+    results = {'summaries': []}
+    monkeypatch.setattr(cls, '_print_result_summary', lambda self, action, target, total_count, error_count: results['summaries'].append((target, total_count, error_count)))
+    monkeypatch.setattr(cls, '_print_error_table', lambda self, data_results=None, label_results=None: results.update(data=data_results, label=label_results))
+    return results
+
+def test_upload_data_collects_worker_errors(label_dir, monkeypatch):
+    api = FailingCreateAPI([make_label('img-0.png'), make_label('img-1.png')], failing_keys=('img-1.png',))
+    monkeypatch.setattr(spb, 'run', api.run)
+    monkeypatch.setattr(label_data, 'recursive_glob_image_files', lambda path: {f'img-{i}.png': f'img-{i}.png' for i in range(3)})
+    monkeypatch.setattr(label_data, 'recursive_glob_label_files', lambda path: {f'img-{i}.png.json': f'img-{i}.png.json' for i in range(3)})
+    for i in range(3):
+        write_label(f'img-{i}.png.json', json.dumps({'result': {'objects': []}}))
+    results = capture_results(monkeypatch, label_data.LabelData)
+
+    label_data.LabelData().upload_data(make_project(), 'dataset', str(label_dir), True, True)
+
+    assert results['data'] == {'img-1.png': 'Upload failed'}
+    assert results['label'] == {'img-2.png': 'Label cannot be described.'}
+    assert results['summaries'] == [('data', 3, 1), ('labels', 3, 1)]
+
+@pytest.fixture
+def error_table(tmp_path, monkeypatch):
+    output = io.StringIO()
+    monkeypatch.setattr(label_data, 'console', rich.console.Console(file=output, width=120))
+    for name, logger in (('simple.log', label_data.simple_logger), ('error.log', label_data.logger)):
+        monkeypatch.setattr(logger, 'handlers', [logging.FileHandler(tmp_path / name)] + logger.handlers)
+    keys = []
+    monkeypatch.setattr(click, 'getchar', lambda: keys.pop(0))
+    monkeypatch.setattr(click, 'echo', lambda message=None, nl=True: output.write(message or ''))
+    return output, keys
+
+def test_error_table_prints_nothing_without_errors(error_table):
+    output, _ = error_table
+
+    label_data.LabelData()._print_error_table({}, {})
+
+    assert output.getvalue() == ''
+
+def test_error_table_pages_merged_errors(error_table):
+    output, keys = error_table
+    keys.extend(['n', 'n'])
+    data_results = {f'img-{i:02}.png': 'data error' for i in range(20)}
+    label_results = {f'img-{i:02}.png': 'label error' for i in range(15, 25)}
+
+    label_data.LabelData()._print_error_table(data_results, label_results)
+
+    printed = output.getvalue()
+    assert '(1/3)' in printed and '(2/3)' in printed and '(3/3)' not in printed
+    assert 'DATA UPLOAD' in printed and 'LABEL UPLOAD' in printed
+    assert all(f'img-{i:02}.png' in printed for i in range(25))
+    assert keys == []
+
+def test_error_table_stops_on_quit_and_shows_only_given_columns(error_table):
+    output, keys = error_table
+    keys.append('q')
+
+    label_data.LabelData()._print_error_table(label_results={f'img-{i:02}.png': 'label error' for i in range(15)})
+
+    printed = output.getvalue()
+    assert 'LABEL UPLOAD' in printed and 'DATA UPLOAD' not in printed
+    assert 'img-09.png' in printed and 'img-10.png' not in printed
+
+class FakeProgress:
+    def __init__(self, total=None):
+        self.total = total
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def update(self, n=1):
+        self.count += n
+
+def test_download_fetches_every_label_once_with_bounded_pending(error_table, tmp_path, monkeypatch):
+    monkeypatch.setattr(label_data, 'NUM_WORKERS', 4)
+    labels = [make_label(f'img-{i:03}.png') for i in range(205)]
+    monkeypatch.setattr(spb, 'run', FakeAPI(labels).run)
+    lock = threading.Lock()
+    state = {'held': 0, 'peak': 0}
+    downloaded = []
+    def describe_label_page(option, page_idx):
+        page = labels[page_idx * label_data.LABEL_DESCRIBE_PAGE_SIZE:(page_idx + 1) * label_data.LABEL_DESCRIBE_PAGE_SIZE]
+        with lock:
+            state['held'] += len(page)
+            state['peak'] = max(state['peak'], state['held'])
+        return page
+    def download_label(directory_path, label):
+        time.sleep(0.001)
+        with lock:
+            state['held'] -= 1
+            downloaded.append(label.data_key)
+        key = f'{label.dataset}/{label.data_key}'
+        error = {}
+        if label.data_key in ('img-003.png', 'img-007.png'):
+            error['label'] = 'label error'
+        if label.data_key in ('img-005.png', 'img-007.png'):
+            error['data'] = 'data error'
+        return key, error
+    monkeypatch.setattr(label_data, '_describe_label_page', describe_label_page)
+    monkeypatch.setattr(label_data, '_download_label', download_label)
+    progresses = []
+    monkeypatch.setattr(label_data.tqdm, 'tqdm', lambda total=None: progresses.append(FakeProgress(total)) or progresses[-1])
+    results = {}
+    monkeypatch.setattr(label_data.LabelData, '_print_error_table', lambda self, data_results=None, label_results=None: results.update(data=data_results, label=label_results))
+
+    label_data.LabelData().download(make_project(), str(tmp_path), True)
+
+    assert sorted(downloaded) == [label.data_key for label in labels]
+    assert results['data'] == {'dataset/img-005.png': 'data error', 'dataset/img-007.png': 'data error'}
+    assert results['label'] == {'dataset/img-003.png': 'label error', 'dataset/img-007.png': 'label error'}
+    assert [(progress.total, progress.count) for progress in progresses] == [(205, 205)]
+    assert state['peak'] <= 4 * 2 + label_data.LABEL_DESCRIBE_PAGE_SIZE
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_update_label_accepts_nan_written_by_label_to_json(label_dir, monkeypatch, use_orjson):
+    if use_orjson:
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(label_data, 'orjson', None)
+    api = FakeAPI([make_label('img.png')])
+    monkeypatch.setattr(spb, 'run', api.run)
+    write_label('img.png.json', make_label('img.png', {'objects': [{'score': float('nan')}]}).toJson())
+
+    assert label_data._update_label('project', 'dataset', None, 'img.png.json') == ('img.png', None)
+    update_option = api.calls[-1][1]
+    assert math.isnan(update_option['result']['objects'][0]['score'])
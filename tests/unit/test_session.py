@@ -148,3 +148,21 @@ def test_session_can_handle_exception():
             session.execute(query)
         assert 'The data key is duplicated' in ei.value.message
 
+def test_session_reuses_http_connection_pool():
+    with requests_mock.Mocker() as m:
+        m.post(requests_mock.ANY, json={"data": {"projects": []}})
+        session = Session(access_key='access_key', account_name='account_name')
+        session.execute(query)
+        http = session._http
+        session.execute(query)
+
+    assert http is not None
+    assert session._http is http
+    assert m.call_count == 2
+
+def test_session_sizes_http_pool_from_pool_maxsize():
+    session = Session(access_key='access_key', account_name='account_name', pool_maxsize=64)
+    url = 'https://api.superb-ai.com/graphql'
+    connection_pool = session._get_http().get_adapter(url).poolmanager.connection_from_url(url)
+
+    assert connection_pool.pool.maxsize == 64
@@ -0,0 +1,16 @@
+from spb.cli_core.utils import get_num_workers
+
+
+def test_get_num_workers_reads_environment(monkeypatch):
+    monkeypatch.setenv('SPB_CLI_WORKERS', '8')
+    assert get_num_workers() == 8
+
+    monkeypatch.setenv('SPB_CLI_WORKERS', '0')
+    assert get_num_workers() == 1
+
+def test_get_num_workers_ignores_invalid_value(monkeypatch):
+    monkeypatch.delenv('SPB_CLI_WORKERS', raising=False)
+    default = get_num_workers()
+
+    monkeypatch.setenv('SPB_CLI_WORKERS', 'abc')
+    assert get_num_workers() == default
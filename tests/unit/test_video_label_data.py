@@ -0,0 +1,54 @@
+import io
+import json
+import types
+from multiprocessing.pool import ThreadPool
+import pytest
+import rich.console
+
+import spb
+import spb.cli_core.commands.video_label_data as video_label_data
+from spb.command.commands import CreateCommand
+from spb.models.project import Project
+
+
+class FakeAPI:
+    def __init__(self, data_keys, failing_keys):
+        self.data_keys = data_keys
+        self.failing_keys = failing_keys
+
+    def run(self, command, option={}, page=None, page_size=None, optional={}):
+        if isinstance(command, CreateCommand):
+            if option['data_key'] in self.failing_keys:
+                raise Exception('Upload failed')
+            return types.SimpleNamespace(file_infos='[]')
+        if option['data_key'] not in self.data_keys:
+            return [], 0
+        return [types.SimpleNamespace(id=f"id-{option['data_key']}", dataset=option['dataset'], data_key=option['data_key'], tags=[])], 1
+
+@pytest.fixture
+def video_upload(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Threads see the patched spb.run without relying on fork
+    monkeypatch.setattr(video_label_data, 'Pool', ThreadPool)
+    output = io.StringIO()
+    monkeypatch.setattr(video_label_data, 'console', rich.console.Console(file=output, width=120))
+    results = {}
+    monkeypatch.setattr(video_label_data.VideoLabelData, '_print_error_table', lambda self, data_results=None, label_results=None: results.update(data=data_results, label=label_results))
+    return output, results
+
+def test_upload_data_collects_worker_errors(video_upload, tmp_path, monkeypatch):
+    output, results = video_upload
+    monkeypatch.setattr(spb, 'run', FakeAPI(data_keys=('video-0', 'video-1'), failing_keys=('video-1',)).run)
+    monkeypatch.setattr(video_label_data, 'recursive_glob_video_paths', lambda path: {f'video-{i}': {'path': f'video-{i}', 'file_names': []} for i in range(3)})
+    monkeypatch.setattr(video_label_data, 'recursive_glob_label_files', lambda path: {f'video-{i}.json': f'video-{i}.json' for i in range(3)})
+    for i in range(3):
+        with open(f'video-{i}.json', 'w') as f:
+            f.write(json.dumps({'result': None}))
+
+    video_label_data.VideoLabelData().upload_data(Project(id='project', name='project'), 'dataset', str(tmp_path), True, True)
+
+    assert results['data'] == {'video-1': 'Upload failed'}
+    assert results['label'] == {'video-2': 'Label cannot be described.'}
+    printed = output.getvalue()
+    assert 'Successful upload of 2 out of 3 data.' in printed
+    assert 'Successful upload of 2 out of 3 labels.' in printed